@@ -1,10 +1,21 @@
+import functools
+import inspect
 import os
-from typing import Any, TypedDict, Tuple
+import threading
+from typing import Any, Optional, TypedDict, Tuple
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+
+# Serialización de figuras con orjson (vectoriza los arrays numéricos)
+pio.json.config.default_engine = "orjson"
 
 import dash
 import dash_bootstrap_components as dbc
@@ -15,39 +26,100 @@ import dash_ag_grid as dag
 # -----------------------------
 # CARGA DE DATOS (assets/)
 # -----------------------------
-def get_data() -> pd.DataFrame:
+EXPECTED_COLUMNS = ["ADUANA", "kilo_neto", "kilo_bruto", "total", "mercaderias_distintas"]
+
+# Singleton por proceso: el parquet es de solo lectura, se carga una única vez.
+_DATA: Optional[pd.DataFrame] = None
+_DATA_LOCK = threading.Lock()
+
+
+def _load_data() -> pd.DataFrame:
     """
     Carga la tabla agregada por puerto:
       columnas esperadas: ADUANA, kilo_neto, kilo_bruto, total, mercaderias_distintas
-    Lee primero Parquet en assets/, si no existe prueba CSV.
+    Lee primero Arrow IPC en assets/, después Parquet y por último CSV.
     """
+    base_arrow = os.path.join("assets", "tabla1_puertos.arrow")
     base_parquet = os.path.join("assets", "tabla1_puertos.parquet")
-    #base_csv = os.path.join("assets", "tabla1_puertos.csv")
-
-    if os.path.exists(base_parquet):
-        df = pd.read_parquet(base_parquet, engine="pyarrow")
+    base_csv = os.path.join("assets", "tabla1_puertos.csv")
+
+    from_arrow = os.path.exists(base_arrow)
+    from_parquet = os.path.exists(base_parquet)
+    if from_arrow:
+        # Arrow IPC (Feather v2 sin compresión): mmap directo a los buffers,
+        # sin descomprimir ni decodificar páginas Parquet en el arranque
+        with pa.memory_map(base_arrow) as source:
+            table = pa.ipc.open_file(source).read_all().select(EXPECTED_COLUMNS)
+        df = table.to_pandas(split_blocks=True)
+    elif from_parquet:
+        # Lectura directa con pyarrow: memory map + proyección de columnas,
+        # y conversión zero-copy a pandas (sin duplicar los buffers numéricos).
+        table = pq.read_table(
+            base_parquet,
+            memory_map=True,
+            pre_buffer=True,
+            use_threads=True,
+            columns=EXPECTED_COLUMNS,
+        )
+        # Conversión única de cortesía: el próximo arranque usa el IPC mmapeado
+        try:
+            with pa.OSFile(base_arrow, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        except OSError:
+            pass  # filesystem de solo lectura: se sigue leyendo Parquet
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
     elif os.path.exists(base_csv):
-        df = pd.read_csv(base_csv, encoding="utf-8-sig")
+        # Fallback CSV con el lector multihilo de Arrow (acepta el BOM de utf-8-sig)
+        table = pacsv.read_csv(
+            base_csv,
+            read_options=pacsv.ReadOptions(use_threads=True, encoding="utf-8-sig"),
+        )
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
     else:
         # DataFrame vacío con columnas esperadas para evitar crashes
-        df = pd.DataFrame(
-            columns=["ADUANA", "kilo_neto", "kilo_bruto", "total", "mercaderias_distintas"]
-        )
+        df = pd.DataFrame(columns=EXPECTED_COLUMNS)
 
     # Tipos
     if "ADUANA" in df.columns:
-        df["ADUANA"] = df["ADUANA"].astype(str)
+        # Cardinalidad baja (decenas de puertos): dictionary-encoded para que
+        # isin/groupby/unique trabajen sobre códigos enteros
+        df["ADUANA"] = df["ADUANA"].astype(str).astype("category")
+        # La clasificación solo depende de ADUANA, que nunca cambia: se
+        # precomputa una vez aquí para que el filtro por tipo sea un isin puro
+        df["port_type"] = classify_port_types(df["ADUANA"]).astype("category")
+    # El parquet ya viene tipado: la coerción por valor solo se paga cuando
+    # alguna columna llega como texto (fallback CSV)
+    for c in ["kilo_neto", "kilo_bruto", "total", "mercaderias_distintas"]:
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    # Limpieza básica: los formatos binarios no traen filas vacías ni nulos,
+    # así que dropna/fillna solo se pagan en el fallback CSV
+    if not (from_arrow or from_parquet):
+        df = df.dropna(how="all")
+        df = df.fillna(0)
+
+    # 32 bits alcanzan para estas métricas agregadas y reducen a la mitad
+    # el ancho de banda de memoria de todos los escaneos posteriores
     for c in ["kilo_neto", "kilo_bruto", "total"]:
         if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors="coerce")
+            df[c] = df[c].astype(np.float32)
     if "mercaderias_distintas" in df.columns:
-        df["mercaderias_distintas"] = pd.to_numeric(df["mercaderias_distintas"], errors="coerce")
-
-    # Limpieza básica
-    df = df.dropna(how="all").fillna(0)
+        df["mercaderias_distintas"] = df["mercaderias_distintas"].astype(np.int32)
     return df
 
 
+def get_data() -> pd.DataFrame:
+    """Devuelve la tabla compartida, cargándola una sola vez por proceso."""
+    global _DATA
+    if _DATA is None:
+        with _DATA_LOCK:
+            if _DATA is None:
+                _DATA = _load_data()
+    return _DATA
+
+
 # -----------------------------
 # FILTROS COMPARTIDOS
 # -----------------------------
@@ -80,67 +152,244 @@ FILTER_CALLBACK_INPUTS = {
 }
 
 
-def classify_port_type(port_name: str) -> str:
-    p = (port_name or "").lower()
-    if "aerop" in p or "airport" in p:
-        return "Aeropuerto"
-    if "pto" in p or "puerto" in p or "port" in p:
-        return "Puerto"
-    if "za" in p or "zona" in p or "frca" in p:
-        return "Zona Franca"
-    return "Frontera Terrestre"
+def classify_port_types(ports: pd.Series) -> pd.Series:
+    """Clasifica una Serie completa de nombres de aduana de forma vectorizada."""
+    low = ports.fillna("").astype(str).str.lower()
+    conds = [
+        low.str.contains("aerop|airport", regex=True),
+        low.str.contains("pto|puerto|port", regex=True),
+        low.str.contains("za|zona|frca", regex=True),
+    ]
+    choices = ["Aeropuerto", "Puerto", "Zona Franca"]
+    return pd.Series(
+        np.select(conds, choices, default="Frontera Terrestre"), index=ports.index
+    )
 
 
-def filter_data(df: pd.DataFrame, **filters) -> pd.DataFrame:
-    df = df.copy()
-    if df.empty:
-        return df
+# Columnas de rango y sus claves de filtro min/max en la UI
+_RANGE_SPECS = [
+    ("total", "total_value_min", "total_value_max"),
+    ("kilo_neto", "net_weight_min", "net_weight_max"),
+    ("kilo_bruto", "gross_weight_min", "gross_weight_max"),
+    ("mercaderias_distintas", "merchandise_count_min", "merchandise_count_max"),
+]
+
+_BOUNDS: Optional[dict] = None
+
+
+def _data_bounds() -> dict:
+    """Min/max globales por columna numérica, calculados una sola vez por proceso."""
+    global _BOUNDS
+    if _BOUNDS is None:
+        df = get_data()
+        if df.empty:
+            _BOUNDS = {}
+        else:
+            agg = df[[c for c, _, _ in _RANGE_SPECS]].agg(["min", "max"])
+            _BOUNDS = {c: (float(agg[c]["min"]), float(agg[c]["max"])) for c in agg.columns}
+    return _BOUNDS
+
+
+def _is_default_filters(filters: dict) -> bool:
+    """True si todos los filtros están en sus valores iniciales (no recortan nada)."""
+    if "all" not in (filters.get("port_selection", ["all"]) or ["all"]):
+        return False
+    if filters.get("top_ports_filter", "all") != "all":
+        return False
+    if "all" not in (filters.get("port_type_filter", ["all"]) or ["all"]):
+        return False
+    bounds = _data_bounds()
+    for col, lo_key, hi_key in _RANGE_SPECS:
+        if col not in bounds:
+            return False
+        lo, hi = filters.get(lo_key), filters.get(hi_key)
+        if lo is not None and float(lo) > bounds[col][0]:
+            return False
+        if hi is not None and float(hi) < bounds[col][1]:
+            return False
+    return True
+
+
+def _ports_mask(aduana: pd.Series, ports) -> np.ndarray:
+    """Máscara isin sobre los códigos enteros de la categórica, no sobre strings."""
+    wanted = aduana.cat.categories.get_indexer(pd.Index(list(ports)))
+    return np.isin(aduana.cat.codes.to_numpy(), wanted[wanted >= 0])
+
+
+def _filter_mask(df: pd.DataFrame, filters: dict) -> np.ndarray:
+    """
+    Máscara booleana combinada de todos los filtros sobre df. Trabaja sobre
+    códigos y ndarrays; el caller materializa el resultado con un único take.
+    """
+    mask = np.ones(len(df), dtype=bool)
 
     # Selección de puertos
     ports = filters.get("port_selection", ["all"]) or ["all"]
     if "all" not in ports:
-        df = df[df["ADUANA"].isin(ports)]
+        mask &= _ports_mask(df["ADUANA"], ports)
 
-    # Top N por total
+    # Top N por total (agrega solo el subconjunto ya seleccionado)
     top_sel = filters.get("top_ports_filter", "all")
     if top_sel != "all":
         try:
             n = int(top_sel)
-            top_ports = df.groupby("ADUANA")["total"].sum().nlargest(n).index.tolist()
-            df = df[df["ADUANA"].isin(top_ports)]
+            # bincount sobre códigos + argpartition: suma y selección parcial
+            # O(N) sin hash table de groupby ni sort completo
+            codes = df["ADUANA"].cat.codes.to_numpy()
+            n_cats = len(df["ADUANA"].cat.categories)
+            sub = codes[mask]
+            sums = np.bincount(sub, weights=df["total"].to_numpy()[mask], minlength=n_cats)
+            observed = np.flatnonzero(np.bincount(sub, minlength=n_cats))
+            k = min(n, observed.size)
+            if k:
+                top = observed[np.argpartition(-sums[observed], k - 1)[:k]]
+                mask &= np.isin(codes, top)
         except Exception:
             pass
 
     # Tipo de puerto
     ptypes = filters.get("port_type_filter", ["all"]) or ["all"]
     if "all" not in ptypes:
-        df["port_type"] = df["ADUANA"].apply(classify_port_type)
-        df = df[df["port_type"].isin(ptypes)]
-
-    # Rangos
-    def _flt(v, lo, hi):
-        return (v >= float(lo)) & (v <= float(hi))
-
-    tmin = filters.get("total_value_min", df["total"].min())
-    tmax = filters.get("total_value_max", df["total"].max())
-    df = df[_flt(df["total"], tmin, tmax)]
-
-    nmin = filters.get("net_weight_min", df["kilo_neto"].min())
-    nmax = filters.get("net_weight_max", df["kilo_neto"].max())
-    df = df[_flt(df["kilo_neto"], nmin, nmax)]
-
-    bmin = filters.get("gross_weight_min", df["kilo_bruto"].min())
-    bmax = filters.get("gross_weight_max", df["kilo_bruto"].max())
-    df = df[_flt(df["kilo_bruto"], bmin, bmax)]
-
-    mmin = filters.get("merchandise_count_min", df["mercaderias_distintas"].min())
-    mmax = filters.get("merchandise_count_max", df["mercaderias_distintas"].max())
-    df = df[
-        (df["mercaderias_distintas"] >= float(mmin))
-        & (df["mercaderias_distintas"] <= float(mmax))
+        mask &= df["port_type"].isin(ptypes).to_numpy()
+
+    # Rangos: una sola máscara fusionada evaluada con pyarrow.compute
+    # (un pase por columna, sin DataFrames intermedios por predicado)
+    bounds = _data_bounds()
+    arrow_mask = None
+    for col, lo_key, hi_key in _RANGE_SPECS:
+        blo, bhi = bounds.get(col, (float("-inf"), float("inf")))
+        lo = filters.get(lo_key)
+        hi = filters.get(hi_key)
+        # Cast único por límite; un límite ausente/vacío no recorta nada
+        lo = blo if lo is None else float(lo)
+        hi = bhi if hi is None else float(hi)
+        if lo <= blo and hi >= bhi:
+            continue
+        arr = pa.array(df[col].to_numpy())
+        m = pc.and_(pc.greater_equal(arr, lo), pc.less_equal(arr, hi))
+        arrow_mask = m if arrow_mask is None else pc.and_(arrow_mask, m)
+    if arrow_mask is not None:
+        mask &= arrow_mask.to_numpy(zero_copy_only=False)
+
+    return mask
+
+
+def filter_data(df: pd.DataFrame, **filters) -> pd.DataFrame:
+    # Sin copia inicial: la tabla compartida nunca se muta; todos los filtros
+    # se acumulan en una máscara y las filas se materializan una sola vez
+    if df.empty:
+        return df
+    return df[_filter_mask(df, filters)]
+
+
+def _aggregate_ports(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Suma total/kilo_neto/kilo_bruto/mercaderias_distintas por ADUANA.
+    Equivale a groupby('ADUANA').agg(sum, ...) pero reutiliza los códigos de la
+    categórica y suma las cuatro columnas con np.bincount, sin armar una hash
+    table por llamada.
+    """
+    codes = df["ADUANA"].cat.codes.to_numpy()
+    n_cats = len(df["ADUANA"].cat.categories)
+    observed = np.flatnonzero(np.bincount(codes, minlength=n_cats))
+    out = {"ADUANA": df["ADUANA"].cat.categories[observed]}
+    for col in ("total", "kilo_neto", "kilo_bruto", "mercaderias_distintas"):
+        sums = np.bincount(codes, weights=df[col].to_numpy(), minlength=n_cats)
+        out[col] = sums[observed]
+    agg = pd.DataFrame(out)
+    agg["mercaderias_distintas"] = agg["mercaderias_distintas"].astype(np.int64)
+    return agg
+
+
+def _memoize_by_inputs(func):
+    """
+    Memoiza un callback de gráfico por la tupla completa de sus entradas.
+    Dash reenvía callbacks con entradas idénticas (doble render inicial,
+    cambios en controles no relacionados); los repetidos devuelven la figura
+    ya construida sin refiltrar ni reserializar nada.
+    """
+    named = [
+        p.name
+        for p in inspect.signature(func).parameters.values()
+        if p.kind == p.POSITIONAL_OR_KEYWORD
     ]
+    cached = functools.lru_cache(maxsize=32)(lambda key: func(**dict(key)))
 
-    return df
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        kwargs.update(zip(named, args))
+        return cached(_filters_key(kwargs))
+
+    return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def _message_figure(text: str) -> go.Figure:
+    """Figura vacía con un mensaje centrado; una sola instancia por texto."""
+    fig = go.Figure()
+    fig.update_layout(
+        annotations=[{"text": text, "showarrow": False, "font": {"size": 18}}]
+    )
+    return fig
+
+
+def _dense_rank_desc(a: np.ndarray) -> np.ndarray:
+    """Ranking denso descendente (1 = mayor) con un único sort vía np.unique."""
+    _, inv = np.unique(-a, return_inverse=True)
+    return (inv + 1).astype(np.int32)
+
+
+def _safe_div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """División elemento a elemento que deja 0 donde el denominador es 0.
+
+    Un solo kernel con where= en lugar de dividir + replace(inf) + fillna,
+    que recorrían y alocaban el array tres veces.
+    """
+    out = np.zeros(len(num), dtype=np.float64)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def _filters_key(filters: dict) -> tuple:
+    """Tupla hasheable y de orden estable a partir de los kwargs de filtros."""
+    return tuple(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in sorted(filters.items())
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _filter_cached(key: tuple) -> pd.DataFrame:
+    return filter_data(get_data(), **dict(key))
+
+
+@functools.lru_cache(maxsize=128)
+def _port_agg_cached(key: tuple) -> pd.DataFrame:
+    return _aggregate_ports(_filter_cached(key) if key else get_data())
+
+
+def port_aggregates(**filters) -> pd.DataFrame:
+    """
+    Agregado por puerto del frame filtrado, cacheado por la tupla de filtros
+    para que ranking y tabla consuman el mismo resultado sin repetir el groupby.
+    Los consumidores no deben mutarlo; quien agregue columnas debe copiar antes.
+    """
+    if _is_default_filters(filters):
+        return _port_agg_cached(())
+    return _port_agg_cached(_filters_key(filters))
+
+
+def filtered_data(**filters) -> pd.DataFrame:
+    """
+    Aplica filter_data sobre la tabla compartida del proceso.
+    Los callbacks pasan solo los escalares de filtro; el DataFrame es implícito
+    y el resultado se cachea por la tupla compacta de filtros, de modo que los
+    callbacks que disparan juntos reutilizan un único frame filtrado.
+    """
+    # Caso más común (carga inicial): ningún filtro recorta, se devuelve
+    # la tabla compartida sin escanear ninguna columna
+    if _is_default_filters(filters):
+        return get_data()
+    return _filter_cached(_filters_key(filters))
 
 
 # -----------------------------
@@ -154,15 +403,34 @@ app = dash.Dash(
 server = app.server
 
 _df = get_data()
-unique_ports = sorted(_df["ADUANA"].dropna().unique().tolist()) if not _df.empty else []
-total_min, total_max = (_df["total"].min(), _df["total"].max()) if not _df.empty else (0, 0)
-net_min, net_max = (_df["kilo_neto"].min(), _df["kilo_neto"].max()) if not _df.empty else (0, 0)
-gross_min, gross_max = (_df["kilo_bruto"].min(), _df["kilo_bruto"].max()) if not _df.empty else (0, 0)
-merc_min, merc_max = (
-    (_df["mercaderias_distintas"].min(), _df["mercaderias_distintas"].max()) if not _df.empty else (0, 0)
-)
-
-port_types = sorted(list({classify_port_type(p) for p in unique_ports}))
+# Calienta el agregado por puerto del caso sin filtros en el arranque, así el
+# primer render de cada worker no paga el groupby
+_PORT_AGG = port_aggregates()
+# Las categorías de la dictionary-encoded ya son los valores únicos: sin escaneo
+unique_ports = sorted(_df["ADUANA"].cat.categories.tolist()) if not _df.empty else []
+if not _df.empty:
+    # Un solo agregado fusionado en lugar de ocho reducciones independientes
+    _b = _data_bounds()
+    total_min, total_max = _b["total"]
+    net_min, net_max = _b["kilo_neto"]
+    gross_min, gross_max = _b["kilo_bruto"]
+    merc_min, merc_max = _b["mercaderias_distintas"]
+else:
+    total_min = total_max = net_min = net_max = 0
+    gross_min = gross_max = merc_min = merc_max = 0
+
+port_types = sorted(_df["port_type"].unique().tolist()) if not _df.empty else []
+
+# Opciones de los dropdowns construidas una sola vez al iniciar el proceso
+PORT_OPTIONS = [{"label": "Todos", "value": "all"}] + [
+    {"label": p, "value": p} for p in unique_ports
+]
+TOP_PORTS_OPTIONS = [{"label": "Todos", "value": "all"}] + [
+    {"label": f"Top {n}", "value": n} for n in [5, 10, 15, 20]
+]
+PORT_TYPE_OPTIONS = [{"label": "Todos", "value": "all"}] + [
+    {"label": t, "value": t} for t in port_types
+]
 
 header = html.Header(
     dbc.Container(
@@ -220,8 +488,7 @@ filters_card = dbc.Card(
                                         html.Label("Selección de Puerto"),
                                         dcc.Dropdown(
                                             id=FILTER_COMPONENT_IDS.port_selection,
-                                            options=[{"label": "Todos", "value": "all"}]
-                                            + [{"label": p, "value": p} for p in unique_ports],
+                                            options=PORT_OPTIONS,
                                             value=["all"],
                                             multi=True,
                                         ),
@@ -233,13 +500,7 @@ filters_card = dbc.Card(
                                         html.Label("Top Puertos"),
                                         dcc.Dropdown(
                                             id=FILTER_COMPONENT_IDS.top_ports_filter,
-                                            options=[
-                                                {"label": "Todos", "value": "all"},
-                                                {"label": "Top 5", "value": 5},
-                                                {"label": "Top 10", "value": 10},
-                                                {"label": "Top 15", "value": 15},
-                                                {"label": "Top 20", "value": 20},
-                                            ],
+                                            options=TOP_PORTS_OPTIONS,
                                             value="all",
                                         ),
                                     ],
@@ -250,8 +511,7 @@ filters_card = dbc.Card(
                                         html.Label("Tipo de Puerto"),
                                         dcc.Dropdown(
                                             id=FILTER_COMPONENT_IDS.port_type_filter,
-                                            options=[{"label": "Todos", "value": "all"}]
-                                            + [{"label": t, "value": t} for t in port_types],
+                                            options=PORT_TYPE_OPTIONS,
                                             value=["all"],
                                             multi=True,
                                         ),
@@ -396,6 +656,21 @@ kpi_cards = dbc.Row(
     className="mb-4",
 )
 
+def _chart_card(title: str, controls: dbc.Row, graph_id: str) -> dbc.Card:
+    """Tarjeta estándar de gráfico: título, controles, gráfico con spinner y error."""
+    return dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5(title, className="card-title"),
+                controls,
+                dcc.Loading(dcc.Graph(id=f"{graph_id}_graph"), type="circle"),
+                html.Pre(id=f"{graph_id}_error", style={"color": "red"}),
+            ]
+        ),
+        className="mb-4",
+    )
+
+
 # Gráfico 1: Ranking por Valor
 ranking_controls = dbc.Row(
     [
@@ -430,16 +705,8 @@ ranking_controls = dbc.Row(
     className="mb-2",
 )
 
-ranking_card = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H5("Ranking de Puertos por Valor Total de Importación", className="card-title"),
-            ranking_controls,
-            dcc.Loading(dcc.Graph(id="ranking_graph"), type="circle"),
-            html.Pre(id="ranking_error", style={"color": "red"}),
-        ]
-    ),
-    className="mb-4",
+ranking_card = _chart_card(
+    "Ranking de Puertos por Valor Total de Importación", ranking_controls, "ranking"
 )
 
 # Gráfico 2: Scatter Volumen vs Valor (peso vs total)
@@ -479,16 +746,8 @@ scatter_controls = dbc.Row(
     className="mb-2",
 )
 
-scatter_card = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H5("Volumen vs Valor Monetario de Importación", className="card-title"),
-            scatter_controls,
-            dcc.Loading(dcc.Graph(id="scatter_graph"), type="circle"),
-            html.Pre(id="scatter_error", style={"color": "red"}),
-        ]
-    ),
-    className="mb-4",
+scatter_card = _chart_card(
+    "Volumen vs Valor Monetario de Importación", scatter_controls, "scatter"
 )
 
 # Gráfico 3: Treemap distribución de peso (color por valor)
@@ -513,22 +772,12 @@ treemap_controls = dbc.Row(
     className="mb-2",
 )
 
-treemap_card = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H5("Distribución de Peso por Puerto", className="card-title"),
-            treemap_controls,
-            dcc.Loading(dcc.Graph(id="treemap_graph"), type="circle"),
-            html.Pre(id="treemap_error", style={"color": "red"}),
-        ]
-    ),
-    className="mb-4",
-)
+treemap_card = _chart_card("Distribución de Peso por Puerto", treemap_controls, "treemap")
 
 # Gráfico 4: Radar de desempeño
-# Cálculo previo de top 10 por total para el selector
+# Top 10 por total para el selector, derivado del agregado ya calentado
 _top_ports = (
-    _df.groupby("ADUANA")["total"].sum().nlargest(10).index.tolist() if not _df.empty else []
+    _PORT_AGG.nlargest(10, "total")["ADUANA"].tolist() if not _PORT_AGG.empty else []
 )
 radar_controls = dbc.Row(
     [
@@ -560,17 +809,7 @@ radar_controls = dbc.Row(
     className="mb-2",
 )
 
-radar_card = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H5("Radar de Desempeño de Puertos", className="card-title"),
-            radar_controls,
-            dcc.Loading(dcc.Graph(id="radar_graph"), type="circle"),
-            html.Pre(id="radar_error", style={"color": "red"}),
-        ]
-    ),
-    className="mb-4",
-)
+radar_card = _chart_card("Radar de Desempeño de Puertos", radar_controls, "radar")
 
 # Tabla (AgGrid)
 table_card = dbc.Card(
@@ -643,42 +882,36 @@ app.layout = html.Div(
 # -----------------------------
 # CALLBACKS
 # -----------------------------
-@callback(Output("total_results", "children"), FILTER_CALLBACK_INPUTS)
-def display_count(**kwargs):
-    df = get_data()
-    total = len(df)
-    fdf = filter_data(df, **kwargs)
-    return f"{len(fdf):,} / {total:,} filas"
-
-
 @callback(
     [
         Output("total_ports_card", "children"),
         Output("total_weight_card", "children"),
         Output("avg_weight_card", "children"),
         Output("top_port_card", "children"),
+        Output("total_results", "children"),
     ],
     FILTER_CALLBACK_INPUTS,
 )
 def update_kpis(**kwargs):
-    df = filter_data(get_data(), **kwargs)
+    # KPIs y contador de filas comparten el mismo frame filtrado
+    df = filtered_data(**kwargs)
+    count_text = f"{len(df):,} / {len(get_data()):,} filas"
     if df.empty:
-        return ["—", "—", "—", "—"]
+        return ["—", "—", "—", "—", count_text]
 
     total_ports = len(df)
-    total_weight_tons = df["kilo_neto"].sum() / 1000.0
+    # Una sola extracción del ndarray: sum + argmax sin pasar por idxmax/.loc
+    kilo_neto = df["kilo_neto"].to_numpy()
+    total_weight_tons = float(kilo_neto.sum()) / 1000.0
     avg_weight_tons = (total_weight_tons / total_ports) if total_ports > 0 else 0
-    top_port = (
-        df.loc[df["kilo_neto"].idxmax(), "ADUANA"]
-        if "kilo_neto" in df and not df["kilo_neto"].isna().all()
-        else "—"
-    )
+    top_port = df["ADUANA"].iloc[int(kilo_neto.argmax())] if kilo_neto.size else "—"
 
     return [
         f"{total_ports:,}",
         f"{total_weight_tons:,.0f}",
         f"{avg_weight_tons:,.0f}",
         (str(top_port)[:20] + "...") if len(str(top_port)) > 20 else str(top_port),
+        count_text,
     ]
 
 
@@ -692,20 +925,21 @@ def update_kpis(**kwargs):
         **FILTER_CALLBACK_INPUTS,
     },
 )
+@_memoize_by_inputs
 def update_ranking(top_n, sort_order, **filters) -> Tuple[go.Figure, str]:
-    empty = go.Figure()
     try:
-        df = filter_data(get_data(), **filters)
+        df = filtered_data(**filters)
         if df.empty:
-            empty.update_layout(
-                annotations=[{"text": "Sin datos disponibles", "showarrow": False, "font": {"size": 18}}]
-            )
-            return empty, ""
-
-        # Agrega por puerto
-        port_totals = df.groupby("ADUANA")["total"].sum().reset_index()
-        ascending = (sort_order or "desc") == "asc"
-        port_totals = port_totals.sort_values("total", ascending=ascending).head(top_n or 10)
+            return _message_figure("Sin datos disponibles"), ""
+
+        # Agregado por puerto compartido con la tabla (cacheado por filtros)
+        port_totals = port_aggregates(**filters)[["ADUANA", "total"]]
+        # Selección parcial top/bottom-N en lugar de ordenar todo y cortar
+        n = top_n or 10
+        if (sort_order or "desc") == "asc":
+            port_totals = port_totals.nsmallest(n, "total")
+        else:
+            port_totals = port_totals.nlargest(n, "total")
 
         # Reordenar para horizontal
         port_totals = port_totals.sort_values("total", ascending=True)
@@ -724,10 +958,7 @@ def update_ranking(top_n, sort_order, **filters) -> Tuple[go.Figure, str]:
 
         return fig, ""
     except Exception as e:
-        empty.update_layout(
-            annotations=[{"text": "Error al actualizar el gráfico", "showarrow": False, "font": {"size": 18}}]
-        )
-        return empty, str(e)
+        return _message_figure("Error al actualizar el gráfico"), str(e)
 
 
 # --- Scatter Volumen vs Valor ---
@@ -739,32 +970,28 @@ def update_ranking(top_n, sort_order, **filters) -> Tuple[go.Figure, str]:
         **FILTER_CALLBACK_INPUTS,
     },
 )
+@_memoize_by_inputs
 def update_scatter(weight_type, size_factor, **filters) -> Tuple[go.Figure, str]:
-    empty = go.Figure()
     try:
-        df = filter_data(get_data(), **filters)
+        df = filtered_data(**filters)
         if df.empty:
-            empty.update_layout(
-                annotations=[{"text": "Sin datos disponibles", "showarrow": False, "font": {"size": 18}}]
-            )
-            return empty, ""
+            return _message_figure("Sin datos disponibles"), ""
 
         wt = weight_type or "kilo_neto"
         sf = float(size_factor or 1.0)
 
-        # scatter por puerto (agregado)
-        agg = df.groupby("ADUANA").agg(
-            total=("total", "sum"),
-            kilo_neto=("kilo_neto", "sum"),
-            kilo_bruto=("kilo_bruto", "sum"),
-            mercaderias_distintas=("mercaderias_distintas", "sum"),
-        ).reset_index()
+        # scatter por puerto: mismo agregado cacheado que ranking y tabla
+        agg = port_aggregates(**filters)
+
+        # Tamaños en un solo buffer ndarray: escala y piso sin Series intermedias
+        sizes = agg["mercaderias_distintas"].to_numpy(dtype=np.float64) * sf
+        np.maximum(sizes, 1.0, out=sizes)
 
         fig = px.scatter(
             agg,
             x=wt,
             y="total",
-            size=np.maximum(agg["mercaderias_distintas"] * sf, 1.0),
+            size=sizes,
             hover_name="ADUANA",
             labels={
                 wt: ("Peso Neto (kg)" if wt == "kilo_neto" else "Peso Bruto (kg)"),
@@ -776,10 +1003,7 @@ def update_scatter(weight_type, size_factor, **filters) -> Tuple[go.Figure, str]
 
         return fig, ""
     except Exception as e:
-        empty.update_layout(
-            annotations=[{"text": "Error al actualizar el gráfico", "showarrow": False, "font": {"size": 18}}]
-        )
-        return empty, str(e)
+        return _message_figure("Error al actualizar el gráfico"), str(e)
 
 
 # --- Treemap de Peso (color por valor) ---
@@ -787,33 +1011,28 @@ def update_scatter(weight_type, size_factor, **filters) -> Tuple[go.Figure, str]
     [Output("treemap_graph", "figure"), Output("treemap_error", "children")],
     {"weight_type": Input("treemap_weight_type", "value"), **FILTER_CALLBACK_INPUTS},
 )
+@_memoize_by_inputs
 def update_treemap(weight_type, **filters) -> Tuple[go.Figure, str]:
-    empty = go.Figure()
     try:
-        df = filter_data(get_data(), **filters)
+        df = filtered_data(**filters)
         if df.empty:
-            empty.update_layout(annotations=[{"text": "Sin datos disponibles", "showarrow": False, "font": {"size": 18}}])
-            return empty, ""
+            return _message_figure("Sin datos disponibles"), ""
 
         wt = weight_type or "kilo_neto"
-        agg = df.groupby("ADUANA").agg(
-            kilo_neto=("kilo_neto", "sum"),
-            kilo_bruto=("kilo_bruto", "sum"),
-            total=("total", "sum"),
-            mercaderias_distintas=("mercaderias_distintas", "sum"),
-        ).reset_index()
+        # Mismo agregado cacheado que el resto de los gráficos; copia porque
+        # abajo se agregan las columnas derivadas de despliegue
+        agg = port_aggregates(**filters).copy()
 
         agg["peso_millones"] = agg[wt] / 1_000_000
         agg["valor_billones"] = agg["total"] / 1_000_000_000_000
 
-        # umbral de legibilidad (5% inferior)
-        thresh = agg["peso_millones"].quantile(0.05)
-        agg = agg[agg["peso_millones"] >= thresh]
+        # umbral de legibilidad (5% inferior); con pocos puertos el recorte
+        # eliminaría a lo sumo una fila, así que se omite el sort del cuantil
+        if len(agg) > 40:
+            thresh = agg["peso_millones"].quantile(0.05)
+            agg = agg[agg["peso_millones"] >= thresh]
         if agg.empty:
-            empty.update_layout(
-                annotations=[{"text": "No hay datos significativos para mostrar", "showarrow": False, "font": {"size": 18}}]
-            )
-            return empty, ""
+            return _message_figure("No hay datos significativos para mostrar"), ""
 
         weight_label = "Peso Neto" if wt == "kilo_neto" else "Peso Bruto"
         fig = px.treemap(
@@ -835,10 +1054,7 @@ def update_treemap(weight_type, **filters) -> Tuple[go.Figure, str]:
 
         return fig, ""
     except Exception as e:
-        empty.update_layout(
-            annotations=[{"text": "Error al actualizar el gráfico", "showarrow": False, "font": {"size": 18}}]
-        )
-        return empty, str(e)
+        return _message_figure("Error al actualizar el gráfico"), str(e)
 
 
 # --- Radar de Desempeño ---
@@ -846,61 +1062,61 @@ def update_treemap(weight_type, **filters) -> Tuple[go.Figure, str]:
     [Output("radar_graph", "figure"), Output("radar_error", "children")],
     {"ports": Input("radar_ports", "value"), "normalize": Input("radar_normalize", "value"), **FILTER_CALLBACK_INPUTS},
 )
+@_memoize_by_inputs
 def update_radar(ports, normalize, **filters) -> Tuple[go.Figure, str]:
-    empty = go.Figure()
     try:
-        df = filter_data(get_data(), **filters)
+        df = filtered_data(**filters)
         if df.empty:
-            empty.update_layout(annotations=[{"text": "Sin datos disponibles", "showarrow": False, "font": {"size": 18}}])
-            return empty, ""
+            return _message_figure("Sin datos disponibles"), ""
 
         selected_ports = ports or []
         if not selected_ports:
-            empty.update_layout(
-                annotations=[{"text": "Seleccione al menos un puerto", "showarrow": False, "font": {"size": 18}}]
-            )
-            return empty, ""
-
-        f = df[df["ADUANA"].isin(selected_ports)]
-        if f.empty:
-            empty.update_layout(
-                annotations=[{"text": "Sin datos para los puertos seleccionados", "showarrow": False, "font": {"size": 18}}]
-            )
-            return empty, ""
-
-        pm = f.groupby("ADUANA").agg(
-            total=("total", "sum"),
-            kilo_neto=("kilo_neto", "sum"),
-            kilo_bruto=("kilo_bruto", "sum"),
-            mercaderias_distintas=("mercaderias_distintas", "sum"),
-        ).reset_index()
-
-        pm["eficiencia_peso"] = (pm["kilo_neto"] / pm["kilo_bruto"]).replace([np.inf, -np.inf], 0).fillna(0)
-        pm["valor_por_kg"] = (pm["total"] / pm["kilo_neto"]).replace([np.inf, -np.inf], 0).fillna(0)
+            return _message_figure("Seleccione al menos un puerto"), ""
+
+        # El agregado es por puerto, así que restringirlo a la selección después
+        # de agregar equivale a agregar el subconjunto; copia por las columnas
+        # derivadas que se calculan abajo
+        pm = port_aggregates(**filters)
+        pm = pm[pm["ADUANA"].isin(selected_ports)].copy()
+        if pm.empty:
+            return _message_figure("Sin datos para los puertos seleccionados"), ""
+
+        pm["eficiencia_peso"] = _safe_div(
+            pm["kilo_neto"].to_numpy(np.float64), pm["kilo_bruto"].to_numpy(np.float64)
+        )
+        pm["valor_por_kg"] = _safe_div(
+            pm["total"].to_numpy(np.float64), pm["kilo_neto"].to_numpy(np.float64)
+        )
 
         metrics = ["total", "kilo_neto", "mercaderias_distintas", "eficiencia_peso", "valor_por_kg"]
         metric_labels = ["Valor Total (Gs)", "Peso Neto (kg)", "Cant. Mercaderías", "Efic. Peso", "Valor por kg (Gs/kg)"]
 
-        norm_on = isinstance(normalize, list) and ("enabled" in normalize)
-        plot_cols = []
+        norm_on = bool(normalize) and ("enabled" in normalize)
         if norm_on:
-            for m in metrics:
-                col = f"{m}_norm"
-                lo, hi = pm[m].min(), pm[m].max()
-                pm[col] = 1.0 if lo == hi else (pm[m] - lo) / (hi - lo)
-                plot_cols.append(col)
+            # Normalización min-max de las cinco métricas en una sola pasada 2D
+            M = pm[metrics].to_numpy(dtype=np.float64)
+            lo = M.min(axis=0)
+            rng = M.max(axis=0) - lo
+            degenerate = rng == 0
+            rng[degenerate] = 1.0
+            M = (M - lo) / rng
+            M[:, degenerate] = 1.0
+            plot_cols = [f"{m}_norm" for m in metrics]
+            pm[plot_cols] = M
         else:
             plot_cols = metrics
 
+        # Una sola reindexación: matriz (puertos x métricas) en lugar de
+        # filtrar el frame y extraer celda por celda dentro del bucle
+        mat = pm.set_index("ADUANA")[plot_cols].reindex(list(selected_ports)).to_numpy()
+        theta = metric_labels + [metric_labels[0]]
         fig = go.Figure()
-        for port in selected_ports:
-            row = pm[pm["ADUANA"] == port]
-            if row.empty:
+        for port, vals in zip(selected_ports, mat):
+            if np.isnan(vals).any():  # puerto sin filas tras el filtrado
                 continue
-            vals = [row[c].iloc[0] for c in plot_cols]
-            vals.append(vals[0])  # cerrar el polígono
+            r = np.concatenate([vals, vals[:1]])  # cerrar el polígono
             fig.add_trace(
-                go.Scatterpolar(r=vals, theta=metric_labels + [metric_labels[0]], fill="toself", name=port, opacity=0.7)
+                go.Scatterpolar(r=r, theta=theta, fill="toself", name=port, opacity=0.7)
             )
 
         fig.update_layout(
@@ -911,10 +1127,7 @@ def update_radar(ports, normalize, **filters) -> Tuple[go.Figure, str]:
 
         return fig, ""
     except Exception as e:
-        empty.update_layout(
-            annotations=[{"text": "Error al actualizar el gráfico", "showarrow": False, "font": {"size": 18}}]
-        )
-        return empty, str(e)
+        return _message_figure("Error al actualizar el gráfico"), str(e)
 
 
 # --- Tabla (AgGrid) ---
@@ -922,27 +1135,26 @@ def update_radar(ports, normalize, **filters) -> Tuple[go.Figure, str]:
     [Output("data_table_grid", "columnDefs"), Output("data_table_grid", "rowData"), Output("data_table_title", "children")],
     FILTER_CALLBACK_INPUTS,
 )
+@_memoize_by_inputs
 def update_table(**filters):
     try:
-        df = filter_data(get_data(), **filters)
+        df = filtered_data(**filters)
         if df.empty:
             return [], [], "Sin datos"
 
-        # limit
-        df = df.head(10_000)
+        # Agregado por puerto compartido con el ranking (cacheado por filtros);
+        # copia porque abajo se agregan las columnas de ranking
+        port_rankings = port_aggregates(**filters).copy()
 
-        # Agrega por puerto
-        port_rankings = (
-            df.groupby("ADUANA")
-            .agg(total=("total", "sum"), kilo_neto=("kilo_neto", "sum"), kilo_bruto=("kilo_bruto", "sum"), mercaderias_distintas=("mercaderias_distintas", "sum"))
-            .reset_index()
+        port_rankings["total_rank"] = _dense_rank_desc(port_rankings["total"].to_numpy())
+        port_rankings["weight_rank"] = _dense_rank_desc(port_rankings["kilo_neto"].to_numpy())
+        port_rankings["diversity_rank"] = _dense_rank_desc(
+            port_rankings["mercaderias_distintas"].to_numpy()
         )
 
-        port_rankings["total_rank"] = port_rankings["total"].rank(method="dense", ascending=False).astype(int)
-        port_rankings["weight_rank"] = port_rankings["kilo_neto"].rank(method="dense", ascending=False).astype(int)
-        port_rankings["diversity_rank"] = port_rankings["mercaderias_distintas"].rank(method="dense", ascending=False).astype(int)
-
-        port_rankings = port_rankings.sort_values("total", ascending=False)
+        # El tope de filas se aplica sobre el agregado (un puerto por fila),
+        # no sobre las filas crudas: así el recorte no altera las sumas
+        port_rankings = port_rankings.sort_values("total", ascending=False).head(10_000)
 
         column_defs = [
             {"headerName": "Ranking (por Valor)", "field": "total_rank", "type": "numericColumn", "filter": "agNumberColumnFilter", "width": 150, "pinned": "left"},
@@ -955,12 +1167,9 @@ def update_table(**filters):
             {"headerName": "Ranking por Diversidad", "field": "diversity_rank", "type": "numericColumn", "filter": "agNumberColumnFilter", "width": 180},
         ]
 
-        df_cleaned = port_rankings.copy()
-        for col in df_cleaned.columns:
-            if pd.api.types.is_numeric_dtype(df_cleaned[col]):
-                df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors="coerce")
-
-        row_data = df_cleaned.replace({np.nan: None}).to_dict("records")
+        # El agregado no puede traer NaN (sumas de columnas ya limpias), así
+        # que se serializa directo sin el upcast a object del barrido NaN->None
+        row_data = port_rankings.to_dict("records")
 
         title_text = f"Mostrando {len(row_data)} puertos (agregado por aduana)"
         return column_defs, row_data, title_text